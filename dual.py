@@ -11,21 +11,64 @@
 __version__ = "0.0"
 __author__ = "dchassin@stanford.edu"
 
-from parse import parse
+import os
+import re
+import ctypes
+import functools
 from math import exp, log, sin, cos, sinh, cosh
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# optional batched kernels built from dual_simd.c
+try:
+    _simd = ctypes.CDLL(os.path.join(os.path.dirname(os.path.abspath(__file__)), "libdual_simd.so"))
+    _simd.dmul.argtypes = [ctypes.c_size_t] + [ctypes.c_void_p]*6
+    _simd.dmul.restype = None
+except OSError:
+    _simd = None
+
 indeterminatechar = "w"
 precision = 1e-8
-parseformat = f"{{:g}}{{:+g}}{indeterminatechar}"
-strformat = f"{{self.x}}{{self.y:+}}{indeterminatechar}"
-reprformat = f"<dual:{{:.4g}}{{:+.4g}}{indeterminatechar}>"
+arraybackend = os.environ.get("DUAL_ARRAY_BACKEND", "numpy")
+simdsize = 10000  # smallest DualArray product sent to the C kernel
+_number = r"(?:(?:\d+(?:\.\d*)?|\.\d+)(?:e[+-]?\d+)?|inf|nan)"
+parsepattern = re.compile(f"([+-]?{_number})([+-]{_number}){re.escape(indeterminatechar)}", re.IGNORECASE)
 
 
 class DualException(Exception):
     pass
 
 
+def _parts(x):
+    """Get the real and indeterminate parts of a dual, number, or string"""
+    if isinstance(x, dual):
+        return x.x, x.y
+    if isinstance(x, str):
+        x = dual(x)
+        return x.x, x.y
+    return float(x), 0.0
+
+
+@functools.lru_cache(maxsize=1024)
+def _parse(x):
+    """Get the real and indeterminate parts of a dual number string"""
+    r = parsepattern.fullmatch(x.replace(" ", ""))
+    if r is None:
+        raise DualException(f"'{x}' is not a dual number")
+    return float(r[1]), float(r[2])
+
+
 class dual:
+    """Dual number x + y*w, where w*w = 0
+
+    Subclasses that need per-instance attributes beyond x and y must add
+    '__dict__' (or the extra names) to their own __slots__.
+    """
+
+    __slots__ = ("x", "y")
 
     def __init__(self,
                  x=0.0,
@@ -41,9 +84,7 @@ class dual:
         y (float) - indeterminate part
         """
         if type(x) is str:
-            r = parse(parseformat, x)
-            self.x = r[0]
-            self.y = r[1]
+            self.x, self.y = _parse(x)
         elif type(x) is dual:
             self.x = x.re()
             self.y = x.im()
@@ -51,121 +92,163 @@ class dual:
             self.x = float(x)
             self.y = float(y)
 
+    @classmethod
+    def _new(cls, x, y):
+        """Construct from float parts without argument checking"""
+        self = object.__new__(cls)
+        self.x = x
+        self.y = y
+        return self
+
     def __str__(self):
-        return strformat.format(self.x, self.y).replace(" ", "")
+        return f"{self.x}{self.y:+}{indeterminatechar}"
 
     def __repr__(self):
-        return reprformat.format(self.x, self.y).replace(" ", "")
+        return f"<dual:{self.x:.4g}{self.y:+.4g}{indeterminatechar}>"
 
     def __neg__(self):
-        return dual(-self.x, -self.y)
+        return dual._new(-self.x, -self.y)
 
     def __pos__(self):
-        return dual(abs(self.x), abs(self.y))
+        return dual._new(self.x, self.y)
 
     def __invert__(self):
-        return dual(1) / self
+        inv = 1.0/self.x
+        return dual._new(inv, -self.y*inv*inv)
 
     def __add__(self, other):
-        if not type(other) is dual:
-            other = dual(other)
-        return dual(self.x+other.x, self.y+other.y)
+        try:
+            ox, oy = _parts(other)
+        except TypeError:
+            return NotImplemented
+        return dual._new(self.x+ox, self.y+oy)
 
     def __sub__(self, other):
-        if not type(other) is dual:
-            other = dual(other)
-        return dual(self.x-other.x, self.y-other.y)
+        try:
+            ox, oy = _parts(other)
+        except TypeError:
+            return NotImplemented
+        return dual._new(self.x-ox, self.y-oy)
 
     def __mul__(self, other):
-        if not type(other) is dual:
-            other = dual(other)
-        return dual(self.x*other.x, self.x*other.y+self.y*other.x)
+        try:
+            ox, oy = _parts(other)
+        except TypeError:
+            return NotImplemented
+        return dual._new(self.x*ox, self.x*oy+self.y*ox)
 
     def __truediv__(self, other):
-        if not type(other) is dual:
-            other = dual(other)
-        return dual(self.x/other.x, (self.y*other.x-self.x*other.y)/(other.x*other.x))
+        try:
+            ox, oy = _parts(other)
+        except TypeError:
+            return NotImplemented
+        x = self.x/ox
+        return dual._new(x, (self.y-x*oy)/ox)
 
     def __pow__(self, n):
         if not type(n) is int:
             raise DualException("n must be an integer")
         elif n > 1:
-            return dual(self.x**n, n*self.x**(n-1)*self.y)
+            p = self.x**(n-1)
+            return dual._new(p*self.x, n*p*self.y)
         elif n == 1:
-            return dual(self.x, self.y)
+            return dual._new(self.x, self.y)
         elif n == 0:
-            return dual(1.0)
+            return dual._new(1.0, 0.0)
         else:
             raise DualException("n must be non-negative")
 
     def __iadd__(self, other):
-        if not type(other) is dual:
-            other = dual(other)
-        self.x += other.x
-        self.y += other.y
+        try:
+            ox, oy = _parts(other)
+        except TypeError:
+            return NotImplemented
+        self.x += ox
+        self.y += oy
         return self
 
     def __isub__(self, other):
-        if not type(other) is dual:
-            other = dual(other)
-        self.x -= other.x
-        self.y -= other.y
+        try:
+            ox, oy = _parts(other)
+        except TypeError:
+            return NotImplemented
+        self.x -= ox
+        self.y -= oy
         return self
 
     def __imul__(self, other):
-        if not type(other) is dual:
-            other = dual(other)
-        self.y *= other.x
-        self.y += self.x*other.y
-        self.x *= other.x
+        try:
+            ox, oy = _parts(other)
+        except TypeError:
+            return NotImplemented
+        self.y *= ox
+        self.y += self.x*oy
+        self.x *= ox
         return self
 
     def __itruediv__(self, other):
-        if not type(other) is dual:
-            other = dual(other)
-        self.y *= other.x
-        self.y -= self.x*other.y
-        self.y /= other.x*other.x
-        self.x /= other.x
+        try:
+            ox, oy = _parts(other)
+        except TypeError:
+            return NotImplemented
+        self.x /= ox
+        self.y = (self.y-self.x*oy)/ox
         return self
 
     def __ipow__(self, other):
-        if not type(other) is dual:
-            other = dual(other)
-        z = dual(self.pow(other))
+        if type(other) is int and other > 0:
+            p = self.x**(other-1)
+            self.y *= other*p
+            self.x *= p
+            return self
+        z = self.pow(other)
         self.x = z.x
         self.y = z.y
         return self
 
     def __eq__(self, other):
-        if type(other) in [int, float, str]:
-            other = dual(other)
-        return abs(self.x-other.x) <= precision and abs(self.y-other.y) <= precision
+        try:
+            ox, oy = _parts(other)
+        except TypeError:
+            return NotImplemented
+        eps = precision
+        return abs(self.x-ox) <= eps and abs(self.y-oy) <= eps
 
     def __ne__(self, other):
-        if type(other) in [int, float, str]:
-            other = dual(other)
-        return abs(self.x-other.x) > precision or abs(self.y-other.y) > precision
+        try:
+            ox, oy = _parts(other)
+        except TypeError:
+            return NotImplemented
+        eps = precision
+        return abs(self.x-ox) > eps or abs(self.y-oy) > eps
 
     def __lt__(self, other):
-        if not type(other) is dual:
-            other = dual(other)
-        return self.x < other.x
+        try:
+            ox = _parts(other)[0]
+        except TypeError:
+            return NotImplemented
+        return self.x < ox
 
     def __le__(self, other):
-        if not type(other) is dual:
-            other = dual(other)
-        return self.x <= other.x
+        try:
+            ox = _parts(other)[0]
+        except TypeError:
+            return NotImplemented
+        return self.x <= ox
 
     def __gt__(self, other):
-        if not type(other) is dual:
-            other = dual(other)
-        return self.x > other.x
+        try:
+            ox = _parts(other)[0]
+        except TypeError:
+            return NotImplemented
+        return self.x > ox
 
     def __ge__(self, other):
-        if not type(other) is dual:
-            other = dual(other)
-        return self.x >= other.x
+        try:
+            ox = _parts(other)[0]
+        except TypeError:
+            return NotImplemented
+        return self.x >= ox
 
     def re(self):
         """Get real part"""
@@ -185,29 +268,27 @@ class dual:
 
     def conj(self):
         """Get the conjugate number"""
-        return dual(self.x, -self.y)
+        return dual._new(self.x, -self.y)
 
     def exp(self):
         """Exponent"""
         ex = exp(self.x)
-        return dual(ex, self.y*ex)
+        return dual._new(ex, self.y*ex)
 
     def pow(self, n):
         """Power"""
-        c = dual(n).re()
+        c, d = _parts(n)
         if c > 0:
             a = self.x
             b = self.y
-            if type(n) in [int]:
-                return dual(a**n, n*a**(n-1)*b)
-            elif type(n) in [float, dual, str]:
-                d = dual(n).im()
-                ex = exp(c*log(a))
-                return dual(ex, ex*(c*b/a+d*log(a)))
-            else:
-                raise DualException("n must be either int, float, dual, or str")
+            if type(n) is int:
+                p = a**(n-1)
+                return dual._new(p*a, n*p*b)
+            la = log(a)
+            ex = exp(c*la)
+            return dual._new(ex, ex*(c*b/a+d*la))
         elif c == 0:
-            return dual(1)
+            return dual._new(1.0, 0.0)
         else:
             raise DualException("n must be non-negative")
 
@@ -217,44 +298,585 @@ class dual:
 
     def sin(self):
         """Sine"""
-        return dual(sin(self.x), self.y*cos(self.x))
+        return dual._new(sin(self.x), self.y*cos(self.x))
 
     def cos(self):
         """Cosine"""
-        return dual(cos(self.x), -self.y*sin(self.x))
+        return dual._new(cos(self.x), -self.y*sin(self.x))
 
     def tan(self):
         """Tangent"""
-        return self.sin() / self.cos()
+        c = cos(self.x)
+        return dual._new(sin(self.x)/c, self.y/(c*c))
 
     def sinh(self):
         """Hypebolic sine"""
-        return dual(sinh(self.x), self.y*cosh(self.x))
+        return dual._new(sinh(self.x), self.y*cosh(self.x))
 
     def cosh(self):
         """Hyperbolic cosine"""
-        return dual(cosh(self.x), self.y*sinh(self.x))
+        return dual._new(cosh(self.x), self.y*sinh(self.x))
 
     def tanh(self):
         """Hyperbolic tangent"""
-        return self.sinh() / self.cosh()
+        c = cosh(self.x)
+        return dual._new(sinh(self.x)/c, self.y/(c*c))
 
     def log(self):
         """Logarithm"""
-        return dual(log(self.x), self.y/self.x)
+        return dual._new(log(self.x), self.y/self.x)
+
+    @staticmethod
+    def compile(fn, arity):
+        """Compile a function of duals into straight-line float code
+
+        fn is called once with placeholders to record its expression, which is
+        then emitted as a single Python function computing the value and
+        derivative of every operation without constructing any duals.
+
+        Arguments:
+
+        fn (callable) - function of arity duals using dual operators and methods
+
+        arity (int) - number of arguments of fn
+
+        Returns:
+
+        function - takes the parts x0, y0, x1, y1, ... of the arguments and
+        returns the parts (x, y) of the result
+        """
+        tape = _Tape()
+        result = fn(*[tape.node("leaf", n) for n in range(arity)])
+        source = tape.source(result, arity)
+        namespace = {"exp": exp, "log": log, "sin": sin, "cos": cos, "sinh": sinh, "cosh": cosh}
+        exec(compile(source, f"<dual.compile {getattr(fn, '__name__', 'fn')}>", "exec"), namespace)
+        return namespace["compiled"]
+
+
+class DualArray:
+    """Array of dual numbers stored as separate real and indeterminate arrays
+
+    All operations are evaluated as whole-array numpy expressions, so
+    differentiating a function over many inputs avoids constructing a dual
+    per element. Scalars, numpy arrays and duals broadcast against the array.
+    """
+
+    __slots__ = ("x", "y")
+
+    # make numpy defer to the reflected operators below
+    __array_ufunc__ = None
+
+    def __init__(self,
+                 x=0.0,
+                 y=0.0,
+                 xp=None,
+                 ):
+        """Construct a dual array
+
+        Arguments:
+
+        x (DualArray|array_like) - dual array to copy or real parts
+
+        y (array_like) - indeterminate parts
+
+        xp (module) - array module, numpy or cupy (default is cupy if x or y
+        is a cupy array, otherwise the module named by arraybackend)
+        """
+        if np is None:
+            raise DualException("DualArray requires numpy")
+        if type(x) is DualArray:
+            x, y = x.x, x.y
+        if xp is None:
+            if _is_cupy(x) or _is_cupy(y):
+                xp = _cupy()
+            else:
+                xp = _array_backend()
+        x = xp.asarray(x, dtype=float)
+        y = xp.asarray(y, dtype=float)
+        if x.shape != y.shape:
+            shape = np.broadcast_shapes(x.shape, y.shape)
+            x = xp.broadcast_to(x, shape)
+            y = xp.broadcast_to(y, shape)
+        self.x = x.copy()
+        self.y = y.copy()
+
+    @classmethod
+    def _new(cls, x, y):
+        """Construct from float arrays without argument checking"""
+        self = object.__new__(cls)
+        self.x = x
+        self.y = y
+        return self
+
+    def __repr__(self):
+        return f"<DualArray:{self.x.tolist()}+{self.y.tolist()}{indeterminatechar}>"
+
+    def __len__(self):
+        return len(self.x)
+
+    def __getitem__(self, key):
+        x = self.x[key]
+        if x.ndim == 0:
+            return dual._new(float(x), float(self.y[key]))
+        return DualArray._new(x, self.y[key])
+
+    def __neg__(self):
+        return DualArray._new(-self.x, -self.y)
+
+    def __add__(self, other):
+        ox, oy = _array_parts(other, self.x)
+        return DualArray._new(self.x+ox, self.y+oy)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        ox, oy = _array_parts(other, self.x)
+        return DualArray._new(self.x-ox, self.y-oy)
+
+    def __rsub__(self, other):
+        ox, oy = _array_parts(other, self.x)
+        return DualArray._new(ox-self.x, oy-self.y)
+
+    def __mul__(self, other):
+        if type(other) is DualArray:
+            if _simd and self.x.size >= simdsize and _contiguous(self, other):
+                x = np.empty(self.x.shape, dtype=np.float64)
+                y = np.empty(self.x.shape, dtype=np.float64)
+                _simd.dmul(x.size, self.x.ctypes.data, self.y.ctypes.data,
+                           other.x.ctypes.data, other.y.ctypes.data, x.ctypes.data, y.ctypes.data)
+                return DualArray._new(x, y)
+            if _is_cupy(self.x):
+                return DualArray._new(*_cupy_dmul()(self.x, self.y, other.x, other.y))
+        ox, oy = _array_parts(other, self.x)
+        return DualArray._new(self.x*ox, self.x*oy+self.y*ox)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        ox, oy = _array_parts(other, self.x)
+        x = self.x/ox
+        return DualArray._new(x, (self.y-x*oy)/ox)
+
+    def __rtruediv__(self, other):
+        ox, oy = _array_parts(other, self.x)
+        return DualArray._new(ox/self.x, (oy*self.x-ox*self.y)/(self.x*self.x))
+
+    def __pow__(self, n):
+        if not type(n) is int:
+            raise DualException("n must be an integer")
+        elif n > 0:
+            p = self.x**(n-1)
+            return DualArray._new(p*self.x, n*p*self.y)
+        elif n == 0:
+            xp = _array_module(self.x)
+            return DualArray._new(xp.ones_like(self.x), xp.zeros_like(self.y))
+        else:
+            raise DualException("n must be non-negative")
+
+    def re(self):
+        """Get real parts"""
+        return self.x
+
+    def im(self):
+        """Get indeterminate parts"""
+        return self.y
+
+    def D(self):
+        """Derivatives"""
+        return self.y
+
+    def exp(self):
+        """Exponent"""
+        xp = _array_module(self.x)
+        ex = xp.exp(self.x)
+        return DualArray._new(ex, self.y*ex)
+
+    def log(self):
+        """Logarithm"""
+        xp = _array_module(self.x)
+        return DualArray._new(xp.log(self.x), self.y/self.x)
+
+    def sin(self):
+        """Sine"""
+        xp = _array_module(self.x)
+        return DualArray._new(xp.sin(self.x), self.y*xp.cos(self.x))
+
+    def cos(self):
+        """Cosine"""
+        xp = _array_module(self.x)
+        return DualArray._new(xp.cos(self.x), -self.y*xp.sin(self.x))
+
+    def tan(self):
+        """Tangent"""
+        xp = _array_module(self.x)
+        c = xp.cos(self.x)
+        return DualArray._new(xp.sin(self.x)/c, self.y/(c*c))
+
+    def sinh(self):
+        """Hyperbolic sine"""
+        xp = _array_module(self.x)
+        return DualArray._new(xp.sinh(self.x), self.y*xp.cosh(self.x))
+
+    def cosh(self):
+        """Hyperbolic cosine"""
+        xp = _array_module(self.x)
+        return DualArray._new(xp.cosh(self.x), self.y*xp.sinh(self.x))
+
+    def tanh(self):
+        """Hyperbolic tangent"""
+        xp = _array_module(self.x)
+        c = xp.cosh(self.x)
+        return DualArray._new(xp.sinh(self.x)/c, self.y/(c*c))
+
+
+def _contiguous(*args):
+    """Check whether dual arrays share a shape and are stored as contiguous float64"""
+    shape = args[0].x.shape
+    for a in args:
+        for v in (a.x, a.y):
+            if type(v) is not np.ndarray or v.dtype != np.float64 or v.shape != shape or not v.flags.c_contiguous:
+                return False
+    return True
+
+
+def _array_parts(x, like):
+    """Get the real and indeterminate parts of an operand of the dual array like"""
+    if isinstance(x, (DualArray, dual)):
+        return x.x, x.y
+    if isinstance(x, (int, float)):
+        return x, 0.0
+    if isinstance(x, str):
+        x = dual(x)
+        return x.x, x.y
+    if type(x).__module__ == "dual_cy":
+        return x.x, x.y
+    return _array_module(like).asarray(x, dtype=float), 0.0
+
+
+def _array_module(a):
+    """Get the array module of the array a"""
+    return _cupy() if _is_cupy(a) else np
+
+
+def _array_backend():
+    """Get the array module named by arraybackend"""
+    if arraybackend == "numpy":
+        return np
+    if arraybackend == "cupy":
+        return _cupy()
+    raise DualException(f"arraybackend '{arraybackend}' is not supported")
+
 
+def _is_cupy(a):
+    """Check whether a is a cupy array without importing cupy"""
+    return type(a).__module__.startswith("cupy")
 
-w = dual(0, 1)
+
+@functools.lru_cache(maxsize=None)
+def _cupy():
+    """Import cupy when it is first needed"""
+    try:
+        import cupy
+    except ImportError:
+        raise DualException("cupy arrays require cupy")
+    return cupy
+
+
+@functools.lru_cache(maxsize=None)
+def _cupy_dmul():
+    """Build the fused cupy kernel for dual array products when it is first needed"""
+    return _cupy().ElementwiseKernel(
+        "float64 ax, float64 ay, float64 bx, float64 by",
+        "float64 rx, float64 ry",
+        "rx = ax*bx; ry = ax*by + ay*bx;",
+        "dmul")
+
+
+def evaluate(fn, arity):
+    """Record a function of duals so each distinct subexpression is computed once
+
+    fn is called once with placeholders that record the expression it builds.
+    Identical subexpressions, e.g., the x*y in (x*y).sin()*(x*y).cos(), are
+    recorded once, and the expression is emitted as a single Python function
+    that computes each of them only once per call.
+
+    Arguments:
+
+    fn (callable) - function of arity duals using dual operators and methods
+
+    arity (int) - number of arguments of fn
+
+    Returns:
+
+    function - takes arity duals (or values dual() accepts) and returns the
+    value of fn
+    """
+    tape = _Tape()
+    result = fn(*[tape.node("leaf", n) for n in range(arity)])
+    return tape.evaluator(result, arity)
+
+
+class _Tape:
+    """Expression graph recorded by evaluate()"""
+
+    __slots__ = ("nodes", "index")
+
+    def __init__(self):
+        self.nodes = []
+        self.index = {}
+
+    def node(self, op, *args):
+        """Get the node for op applied to args, adding it if new"""
+        # constant duals are copied so later in-place changes cannot alter the recording
+        args = tuple(dual._new(a.x, a.y) if isinstance(a, dual) else a for a in args)
+        key = (op,) + tuple(a if type(a) is _Node else (type(a), _parts(a)) for a in args)
+        node = self.index.get(key)
+        if node is None:
+            node = _Node(self, op, args)
+            self.nodes.append(node)
+            self.index[key] = node
+        return node
+
+    def evaluator(self, result, arity):
+        """Generate a function computing the result node from dual arguments"""
+        args = ", ".join(f"a{n}" for n in range(arity))
+        lines = [f"def evaluated({args}):"]
+        namespace = {"dual": dual, "result": result}
+        if type(result) is not _Node:
+            lines.append("    return result")
+        else:
+            names = {}
+            for n, node in enumerate(self.needed(result)):
+                t = names[node] = f"t{n}"
+                if node.op == "leaf":
+                    a = f"a{node.args[0]}"
+                    lines.append(f"    {t} = {a} if type({a}) is dual else dual({a})")
+                    continue
+                operands = []
+                for a in node.args:
+                    if type(a) is _Node:
+                        operands.append(names[a])
+                    else:
+                        operands.append(f"c{n}")
+                        namespace[f"c{n}"] = a
+                if node.op in _operators:
+                    lines.append(f"    {t} = {_operators[node.op].format(*operands)}")
+                else:
+                    lines.append(f"    {t} = {operands[0]}.{node.op}({', '.join(operands[1:])})")
+            lines.append(f"    return {names[result]}")
+        exec(compile("\n".join(lines) + "\n", "<dual.evaluate>", "exec"), namespace)
+        return namespace["evaluated"]
+
+    def needed(self, result):
+        """Get the nodes the result node depends on, in evaluation order"""
+        needed = {result}
+        for node in reversed(self.nodes):
+            if node in needed:
+                needed.update(a for a in node.args if type(a) is _Node)
+        return [node for node in self.nodes if node in needed]
+
+    def source(self, result, arity):
+        """Generate the source of a function computing the parts of the result node"""
+        args = ", ".join(f"x{n}, y{n}" for n in range(arity))
+        lines = [f"def compiled({args}):"]
+        if type(result) is not _Node:
+            c, d = _parts(result)
+            lines.append(f"    return {_literal(c)}, {_literal(d)}")
+            return "\n".join(lines) + "\n"
+        names = {}
+        for n, node in enumerate(self.needed(result)):
+            t = names[node] = (f"t{n}", f"t{n}d")
+            parts = [names[a] if type(a) is _Node else tuple(map(_literal, _parts(a))) for a in node.args]
+            lines.extend("    " + line for line in _emit(node.op, t, parts, node.args))
+        lines.append(f"    return {names[result][0]}, {names[result][1]}")
+        return "\n".join(lines) + "\n"
+
+
+def _literal(value):
+    """Get the Python source for a float"""
+    return repr(value) if value - value == 0 else f"float('{value}')"
+
+
+def _emit(op, t, parts, args):
+    """Generate the statements computing t = (t, td) for an operation on parts"""
+    emitter = _emitters.get(op)
+    if emitter is None:
+        raise DualException(f"operation '{op}' cannot be compiled")
+    if callable(emitter):
+        return emitter(op, t, parts, args)
+    (ax, ay), *other = parts
+    bx, by = other[0] if other else (None, None)
+    return [line.format(t=t[0], td=t[1], ax=ax, ay=ay, bx=bx, by=by, args=args) for line in emitter]
+
+
+def _emit_pow(op, t, parts, args):
+    """Generate the statements computing t = (t, td) for a constant power"""
+    t, td = t
+    ax, ay = parts[0]
+    n = args[1]
+    if type(n) is _Node:
+        raise DualException("compiled exponents must be constant")
+    if op == "__pow__" and not type(n) is int:
+        raise DualException("n must be an integer")
+    c, d = _parts(n)
+    if c == 0:
+        return [f"{t} = 1.0", f"{td} = 0.0"]
+    if not c > 0:
+        raise DualException("n must be non-negative")
+    if type(n) is int:
+        return [f"{t}p = {ax}**{n-1}", f"{t} = {t}p*{ax}", f"{td} = {n}*{t}p*{ay}"]
+    c, d = _literal(c), _literal(d)
+    return [f"{t}l = log({ax})", f"{t} = exp({c}*{t}l)", f"{td} = {t}*({c}*{ay}/{ax}+{d}*{t}l)"]
+
+
+_emitters = {
+    "leaf": ("{t}, {td} = x{args[0]}, y{args[0]}",),
+    "__neg__": ("{t} = -{ax}", "{td} = -{ay}"),
+    "__pos__": ("{t} = {ax}", "{td} = {ay}"),
+    "conj": ("{t} = {ax}", "{td} = -{ay}"),
+    "__invert__": ("{t} = 1.0/{ax}", "{td} = -{ay}*{t}*{t}"),
+    "__add__": ("{t} = {ax}+{bx}", "{td} = {ay}+{by}"),
+    "__sub__": ("{t} = {ax}-{bx}", "{td} = {ay}-{by}"),
+    "__mul__": ("{t} = {ax}*{bx}", "{td} = {ax}*{by}+{ay}*{bx}"),
+    "__truediv__": ("{t} = {ax}/{bx}", "{td} = ({ay}-{t}*{by})/{bx}"),
+    "__pow__": _emit_pow,
+    "pow": _emit_pow,
+    "exp": ("{t} = exp({ax})", "{td} = {ay}*{t}"),
+    "log": ("{t} = log({ax})", "{td} = {ay}/{ax}"),
+    "sin": ("{t} = sin({ax})", "{td} = {ay}*cos({ax})"),
+    "cos": ("{t} = cos({ax})", "{td} = -{ay}*sin({ax})"),
+    "tan": ("{t}c = cos({ax})", "{t} = sin({ax})/{t}c", "{td} = {ay}/({t}c*{t}c)"),
+    "sinh": ("{t} = sinh({ax})", "{td} = {ay}*cosh({ax})"),
+    "cosh": ("{t} = cosh({ax})", "{td} = {ay}*sinh({ax})"),
+    "tanh": ("{t}c = cosh({ax})", "{t} = sinh({ax})/{t}c", "{td} = {ay}/({t}c*{t}c)"),
+}
+
+
+_operators = {
+    "__neg__": "-{0}",
+    "__pos__": "+{0}",
+    "__invert__": "~{0}",
+    "__add__": "{0}+{1}",
+    "__sub__": "{0}-{1}",
+    "__mul__": "{0}*{1}",
+    "__truediv__": "{0}/{1}",
+    "__pow__": "{0}**{1}",
+}
+
+
+class _Node:
+    """Operation recorded on a _Tape"""
+
+    __slots__ = ("tape", "op", "args")
+
+    def __init__(self, tape, op, args):
+        self.tape = tape
+        self.op = op
+        self.args = args
+
+    def __neg__(self):
+        return self.tape.node("__neg__", self)
+
+    def __pos__(self):
+        return self.tape.node("__pos__", self)
+
+    def __invert__(self):
+        return self.tape.node("__invert__", self)
+
+    def __add__(self, other):
+        return self.tape.node("__add__", self, other)
+
+    def __sub__(self, other):
+        return self.tape.node("__sub__", self, other)
+
+    def __mul__(self, other):
+        return self.tape.node("__mul__", self, other)
+
+    def __truediv__(self, other):
+        return self.tape.node("__truediv__", self, other)
+
+    def __pow__(self, n):
+        return self.tape.node("__pow__", self, n)
+
+    def conj(self):
+        return self.tape.node("conj", self)
+
+    def exp(self):
+        return self.tape.node("exp", self)
+
+    def pow(self, n):
+        return self.tape.node("pow", self, n)
+
+    def sin(self):
+        return self.tape.node("sin", self)
+
+    def cos(self):
+        return self.tape.node("cos", self)
+
+    def tan(self):
+        return self.tape.node("tan", self)
+
+    def sinh(self):
+        return self.tape.node("sinh", self)
+
+    def cosh(self):
+        return self.tape.node("cosh", self)
+
+    def tanh(self):
+        return self.tape.node("tanh", self)
+
+    def log(self):
+        return self.tape.node("log", self)
+
+
+w = dual._new(0.0, 1.0)
 
 if __name__ == "__main__":
 
+    import importlib.util
     import unittest
 
+    try:
+        import dual_cy
+    except ImportError:
+        dual_cy = None
+
     x = dual(1, 2)
     y = dual(3, 4)
 
     class TestDual(unittest.TestCase):
 
+        def test_str(self):
+            self.assertEqual(str(x), "1.0+2.0w")
+            self.assertEqual(repr(y/x), "<dual:3-2w>")
+            self.assertEqual(dual(str(x/y)), x/y)
+            self.assertEqual(dual("-1.5e2 - .25w"), dual(-150, -0.25))
+            self.assertRaises(DualException, dual, "1+2")
+
+        def test_unary(self):
+            self.assertEqual(+(-x), -x)
+            self.assertEqual(-(-x), x)
+            self.assertIsNot(+x, x)
+            self.assertEqual(~y, dual(1/3, -4/9))
+            self.assertEqual(~x*x, 1)
+
+        def test_compare(self):
+            self.assertTrue(x == dual(1, 2))
+            self.assertFalse(x != dual(1, 2))
+            self.assertTrue(x != y)
+            self.assertTrue(x != 1)
+            self.assertTrue(dual(1) == 1)
+            self.assertTrue(x == "1+2w")
+            self.assertTrue(x < y and x <= y and y > x and y >= x)
+            self.assertTrue(x < 2 and x <= 1 and x > 0 and x >= 1.0)
+            self.assertTrue(x < "2+0w")
+            self.assertEqual(sorted([y, x, dual(2, -1)]), [x, dual(2, -1), y])
+            self.assertFalse(x == None)  # noqa: E711
+            self.assertTrue(x != None)  # noqa: E711
+            self.assertNotIn(x, [None, 3])
+            self.assertIn(x, [None, dual(1, 2)])
+            self.assertRaises(TypeError, lambda: x < None)
+
         def test_add(self):
             self.assertEqual(x+y, dual(4, 6))
             self.assertEqual(y+x, dual(4, 6))
@@ -267,9 +889,24 @@ if __name__ == "__main__":
             self.assertEqual(x*y, dual(3, 10))
             self.assertEqual(y*x, dual(3, 10))
 
+        def test_scalar(self):
+            self.assertEqual(x+1, dual(2, 2))
+            self.assertEqual(x-1, dual(0, 2))
+            self.assertEqual(x*3, dual(3, 6))
+            self.assertEqual(x/2, dual(0.5, 1))
+            z = dual(x)
+            z += 1
+            z *= 2
+            self.assertEqual(z, dual(4, 4))
+
         def test_div(self):
             self.assertEqual(x/y, dual(1/3, 2/9))
             self.assertEqual(y/x, dual(3, -2))
+            for n in range(1, 200):
+                self.assertEqual((dual(n)/n).x, 1.0)
+                z = dual(n)
+                z /= n
+                self.assertEqual(z.x, 1.0)
 
         def test_pow(self):
             self.assertEqual(x**0, 1)
@@ -282,6 +919,13 @@ if __name__ == "__main__":
             self.assertEqual(x.pow(3), x*x*x)
             self.assertEqual(x.pow(y), dual(1, 6))
             self.assertEqual(y.pow(x), dual(3, 10.59167373200866))
+            z = dual(y)
+            z **= 3
+            self.assertEqual(z, y*y*y)
+            z **= 0.5
+            self.assertEqual(z, (y*y*y).pow(0.5))
+            z **= x
+            self.assertEqual(z, (y*y*y).pow(0.5).pow(x))
 
         def test_exp(self):
             self.assertEqual(x.log().exp(), x)
@@ -303,4 +947,210 @@ if __name__ == "__main__":
             self.assertEqual(x.tanh(), x.sinh()/x.cosh())
             self.assertEqual(x.cosh()**2-x.sinh()**2, 1)
 
+    class TestEvaluate(unittest.TestCase):
+
+        def test_evaluate(self):
+            self.assertEqual(evaluate(lambda a, b: a*b+a, 2)(x, y), x*y+x)
+            self.assertEqual(evaluate(lambda a: (a*2).pow(1.5)/3, 1)(x), (x*2).pow(1.5)/3)
+            self.assertEqual(evaluate(lambda a, b: a.pow(b).log(), 2)(y, "1+2w"), y.pow(x).log())
+            self.assertEqual(evaluate(lambda a: -(~a)**2-(+a).conj(), 1)(x), -(~x)**2-(+x).conj())
+            self.assertEqual(evaluate(lambda a: 2, 1)(x), 2)
+            self.assertEqual(evaluate(lambda a: a*y+a.pow(x), 1)(x), x*y+x.pow(x))
+            k1, k2 = dual(1, 0), dual(1, 0)
+            f = evaluate(lambda a: a*k1+a*k2, 1)
+            k1 += 1
+            k2 *= 2
+            self.assertEqual(f(x), x*2)
+            f = evaluate(lambda a: a.sin()*a.exp(), 1)
+            for a in [x, y, 2.5]:
+                self.assertEqual(f(a), dual(a).sin()*dual(a).exp())
+
+        def test_shared(self):
+            tape = _Tape()
+            a, b = tape.node("leaf", 0), tape.node("leaf", 1)
+            z = (a*b).sin()*(a*b).cos()+(a*b).sin()/2
+            self.assertIs(tape.node("__mul__", a, b).sin(), z.args[0].args[0])
+            self.assertEqual(len(tape.nodes), 8)
+            self.assertEqual(tape.evaluator(z, 2)(x, y), (x*y).sin()*(x*y).cos()+(x*y).sin()/2)
+
+    class TestCompile(unittest.TestCase):
+
+        def assertCompiled(self, fn, *args):
+            parts = []
+            for a in args:
+                parts.extend([a.x, a.y])
+            self.assertEqual(dual(*dual.compile(fn, len(args))(*parts)), fn(*args))
+
+        def test_arith(self):
+            self.assertCompiled(lambda a, b: a*b+a-b/a, x, y)
+            self.assertCompiled(lambda a, b: -(~a)*(+b).conj()-2, x, y)
+            self.assertCompiled(lambda a: a**0+a**1+a**3+a.pow(2)+a.pow(0), y)
+            self.assertCompiled(lambda a: a.pow(1.5)*a.pow("2+1w")/(a*"1+2w"), y)
+
+        def test_functions(self):
+            for name in ["exp", "log", "sin", "cos", "tan", "sinh", "cosh", "tanh"]:
+                self.assertCompiled(lambda a, b: getattr(a*b, name)()*getattr(a*b, name)(), x, y)
+
+        def test_errors(self):
+            self.assertEqual(dual.compile(lambda a: 2, 1)(1.0, 0.0), (2.0, 0.0))
+            self.assertRaises(DualException, dual.compile, lambda a: a**1.5, 1)
+            self.assertRaises(DualException, dual.compile, lambda a: a**-1, 1)
+            self.assertRaises(DualException, dual.compile, lambda a, b: a.pow(b), 2)
+            self.assertRaises(DualException, dual.compile, lambda a: a.pow(float("nan")), 1)
+            self.assertRaises(DualException, dual(1, 2).pow, float("nan"))
+            z = dual(2, 1).pow(float("inf"))
+            self.assertEqual(dual.compile(lambda a: a.pow(float("inf")), 1)(2.0, 1.0), (z.x, z.y))
+            self.assertEqual(dual.compile(lambda a: a/49, 1)(49.0, 1.0)[0], 1.0)
+
+    @unittest.skipIf(dual_cy is None, "dual_cy not built")
+    class TestCython(unittest.TestCase):
+
+        def assertSame(self, expr):
+            cx, cy = dual_cy.dual(x.x, x.y), dual_cy.dual(y.x, y.y)
+            a = eval(expr, {"x": x, "y": y, "dual": dual})
+            b = eval(expr, {"x": cx, "y": cy, "dual": dual_cy.dual})
+            if type(a) is bool:
+                self.assertIs(b, a, expr)
+            else:
+                self.assertIs(type(b), dual_cy.dual, expr)
+                self.assertEqual(dual(b.x, b.y), a, expr)
+
+        def test_arith(self):
+            for expr in ["x+y", "x-y", "x*y", "x/y", "y/x", "-x", "+x", "~y", "x.conj()",
+                         "x+1", "x-1", "x*3", "x/2", "x*'1+2w'", "dual(str(x/y))", "dual('-1.5e2 - .25w')",
+                         "x**0", "x**1", "x**3", "x.pow(0)", "x.pow(3)", "x.pow(y)", "y.pow(x)", "y.pow(2.5)"]:
+                self.assertSame(expr)
+            for n in range(1, 200):
+                self.assertEqual((dual_cy.dual(n)/n).x, 1.0)
+
+        def test_inplace(self):
+            z = dual_cy.dual(x.x, x.y)
+            c = dual_cy.dual(y.x, y.y)
+            z += 1
+            z *= 2
+            z -= c
+            z /= c
+            z **= 3
+            self.assertEqual(dual(z.x, z.y), ((x+1)*2-y)/y*((x+1)*2-y)/y*((x+1)*2-y)/y)
+
+        def test_compare(self):
+            for expr in ["x == dual(1, 2)", "x != dual(1, 2)", "x != y", "x == '1+2w'",
+                         "x < y", "x <= y", "y > x", "y >= x", "x < 2", "x >= 1.0"]:
+                self.assertSame(expr)
+
+        def test_functions(self):
+            for name in ["exp", "log", "sin", "cos", "tan", "sinh", "cosh", "tanh"]:
+                self.assertSame(f"x.{name}()")
+                self.assertSame(f"(x*y).{name}()")
+
+        def test_errors(self):
+            c = dual_cy.dual(1, 2)
+            self.assertRaises(dual_cy.pydual.DualException, c.__pow__, 1.5, None)
+            self.assertRaises(dual_cy.pydual.DualException, c.__pow__, -1, None)
+            self.assertRaises(dual_cy.pydual.DualException, dual_cy.dual, "1+2")
+            self.assertRaises(TypeError, lambda: c+[1])
+            self.assertRaises(TypeError, c.pow, [1])
+            self.assertNotIn(c, [None, 3])
+
+        @unittest.skipIf(np is None, "numpy not available")
+        def test_array(self):
+            c = dual_cy.dual(x.x, x.y)
+            a = DualArray([1, 3], [2, 4])
+            for z in [c*a, a*c]:
+                self.assertTrue(np.allclose(z.x, [1, 3]) and np.allclose(z.y, [4, 10]), z)
+            z = c+a
+            self.assertTrue(np.allclose(z.x, [2, 4]) and np.allclose(z.y, [4, 6]), z)
+            z = c/a
+            self.assertTrue(np.allclose(z.x, [1, 1/3]) and np.allclose(z.y, [0, 2/9]), z)
+            self.assertFalse(c == a)
+
+    @unittest.skipIf(np is None, "numpy not available")
+    class TestDualArray(unittest.TestCase):
+
+        def assertDualArray(self, a, x, y):
+            self.assertTrue(np.allclose(a.x, x) and np.allclose(a.y, y), a)
+
+        def test_arith(self):
+            a = DualArray([1, 3], [2, 4])
+            b = DualArray([3, 1], [4, 2])
+            self.assertDualArray(a+b, [4, 4], [6, 6])
+            self.assertDualArray(a-b, [-2, 2], [-2, 2])
+            self.assertDualArray(a*b, [3, 3], [10, 10])
+            self.assertDualArray(a/b, [1/3, 3], [2/9, -2])
+            self.assertDualArray(a**3, [1, 27], [6, 108])
+            self.assertEqual(a[0], x)
+            self.assertEqual(a[1], y)
+
+        def test_mul_contiguous(self):
+            global simdsize
+            simdsize = 0
+            try:
+                self.check_mul_contiguous()
+            finally:
+                simdsize = 10000
+
+        def check_mul_contiguous(self):
+            a = DualArray(np.linspace(-1, 1, 11), np.linspace(0, 2, 11))
+            b = DualArray(np.linspace(2, 3, 11), np.linspace(1, -1, 11))
+            self.assertDualArray(a*b, a.x*b.x, a.x*b.y+a.y*b.x)
+            self.assertDualArray(a[::2]*b[::2], a.x[::2]*b.x[::2], a.x[::2]*b.y[::2]+a.y[::2]*b.x[::2])
+            a = DualArray([1, 3], [2, 4])
+            b = DualArray([2.5, 3.5], [0.5, 1.5])
+            a.x = a.x.astype(np.int64)
+            self.assertDualArray(a*b, [2.5, 10.5], [5.5, 18.5])
+            a.x = a.x.astype(np.float32)
+            self.assertDualArray(b*a, [2.5, 10.5], [5.5, 18.5])
+
+        def test_backend(self):
+            a = DualArray([1, 3], [2, 4], xp=np)
+            self.assertIs(type(a.sin().x), np.ndarray)
+            global arraybackend
+            arraybackend = "unknown"
+            try:
+                self.assertRaises(DualException, DualArray, [1, 3])
+            finally:
+                arraybackend = "numpy"
+
+        def test_lazy_cupy(self):
+            import subprocess
+            import sys
+            code = "import sys, dual; dual.DualArray([1.0]).sin(); print('cupy' in sys.modules)"
+            out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                                 cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+            self.assertEqual(out.stdout.strip(), "False")
+
+        @unittest.skipIf(importlib.util.find_spec("cupy") is not None, "cupy available")
+        def test_missing_cupy(self):
+            global arraybackend
+            arraybackend = "cupy"
+            try:
+                self.assertRaises(DualException, DualArray, [1, 3])
+            finally:
+                arraybackend = "numpy"
+
+        def test_broadcast(self):
+            a = DualArray([1, 3], [2, 4])
+            self.assertDualArray(a+1, [2, 4], [2, 4])
+            self.assertDualArray(1-a, [0, -2], [-2, -4])
+            self.assertDualArray(2*a, [2, 6], [4, 8])
+            self.assertDualArray(3/a, [3, 1], [-6, -4/3])
+            self.assertDualArray(a*x, [1, 3], [4, 10])
+            self.assertDualArray(x*a, [1, 3], [4, 10])
+            self.assertDualArray(x+a, [2, 4], [4, 6])
+            self.assertDualArray(x-a, [0, -2], [0, -2])
+            self.assertDualArray(y/a, [3, 1], [-2, 0])
+            z = dual(x)
+            z *= a
+            self.assertDualArray(z, [1, 3], [4, 10])
+            self.assertFalse(x == a)
+            self.assertTrue(x != a)
+            self.assertDualArray(np.array([1, 2])*a, [1, 6], [2, 8])
+
+        def test_functions(self):
+            a = DualArray([1, 3], [2, 4])
+            for name in ["exp", "log", "sin", "cos", "tan", "sinh", "cosh", "tanh"]:
+                z = getattr(a, name)()
+                for n in range(len(a)):
+                    self.assertEqual(z[n], getattr(a[n], name)(), name)
+
     unittest.main()
@@ -0,0 +1,280 @@
+# cython: language_level=3
+"""Dual number arithmetic compiled with Cython
+
+This module provides a drop-in replacement for dual.dual that stores the
+parts as C doubles. Build it in place with
+
+    cythonize -i dual_cy.pyx
+
+and import the compiled class explicitly
+
+    from dual_cy import dual
+
+Parsing, precision, and the indeterminate character are shared with the
+dual module.
+"""
+
+cimport cython
+from libc.math cimport exp, log, sin, cos, sinh, cosh, fabs
+
+import dual as pydual
+
+
+cdef inline dual _new(double x, double y):
+    cdef dual self = dual.__new__(dual)
+    self.x = x
+    self.y = y
+    return self
+
+
+cdef int _parts(object other, double *ox, double *oy) except -1:
+    """Get the parts of other, returning 1 if it cannot be coerced"""
+    if type(other) is dual:
+        ox[0] = (<dual>other).x
+        oy[0] = (<dual>other).y
+    elif isinstance(other, pydual.dual):
+        ox[0] = other.x
+        oy[0] = other.y
+    elif isinstance(other, str):
+        ox[0], oy[0] = pydual._parse(other)
+    else:
+        try:
+            ox[0] = other
+        except TypeError:
+            return 1
+        oy[0] = 0.0
+    return 0
+
+
+@cython.final
+cdef class dual:
+    """Dual number x + y*w, where w*w = 0"""
+
+    cdef public double x, y
+
+    def __init__(self,
+                 x=0.0,
+                 y=0.0,
+                 ):
+        """Construct a dual number
+
+        Arguments:
+
+        x (dual|float|int|str) - dual to copy, real part, int of real part, or
+        string representation
+
+        y (float) - indeterminate part
+        """
+        if isinstance(x, (str, dual, pydual.dual)):
+            _parts(x, &self.x, &self.y)
+        else:
+            self.x = x
+            self.y = y
+
+    def __reduce__(self):
+        return dual, (self.x, self.y)
+
+    def __str__(self):
+        return f"{self.x}{self.y:+}{pydual.indeterminatechar}"
+
+    def __repr__(self):
+        return f"<dual:{self.x:.4g}{self.y:+.4g}{pydual.indeterminatechar}>"
+
+    def __neg__(self):
+        return _new(-self.x, -self.y)
+
+    def __pos__(self):
+        return _new(self.x, self.y)
+
+    def __invert__(self):
+        cdef double inv = 1.0/self.x
+        return _new(inv, -self.y*inv*inv)
+
+    def __add__(self, other):
+        cdef double ox, oy
+        if _parts(other, &ox, &oy):
+            return NotImplemented
+        return _new(self.x+ox, self.y+oy)
+
+    def __sub__(self, other):
+        cdef double ox, oy
+        if _parts(other, &ox, &oy):
+            return NotImplemented
+        return _new(self.x-ox, self.y-oy)
+
+    def __mul__(self, other):
+        cdef double ox, oy
+        if _parts(other, &ox, &oy):
+            return NotImplemented
+        return _new(self.x*ox, self.x*oy+self.y*ox)
+
+    def __truediv__(self, other):
+        cdef double ox, oy, x
+        if _parts(other, &ox, &oy):
+            return NotImplemented
+        x = self.x/ox
+        return _new(x, (self.y-x*oy)/ox)
+
+    def __pow__(self, n, mod):
+        cdef double p
+        if not type(n) is int or mod is not None:
+            raise pydual.DualException("n must be an integer")
+        elif n > 0:
+            p = self.x**(n-1)
+            return _new(p*self.x, n*p*self.y)
+        elif n == 0:
+            return _new(1.0, 0.0)
+        else:
+            raise pydual.DualException("n must be non-negative")
+
+    def __iadd__(self, other):
+        cdef double ox, oy
+        if _parts(other, &ox, &oy):
+            return NotImplemented
+        self.x += ox
+        self.y += oy
+        return self
+
+    def __isub__(self, other):
+        cdef double ox, oy
+        if _parts(other, &ox, &oy):
+            return NotImplemented
+        self.x -= ox
+        self.y -= oy
+        return self
+
+    def __imul__(self, other):
+        cdef double ox, oy
+        if _parts(other, &ox, &oy):
+            return NotImplemented
+        self.y = self.y*ox+self.x*oy
+        self.x *= ox
+        return self
+
+    def __itruediv__(self, other):
+        cdef double ox, oy
+        if _parts(other, &ox, &oy):
+            return NotImplemented
+        self.x /= ox
+        self.y = (self.y-self.x*oy)/ox
+        return self
+
+    def __ipow__(self, other):
+        cdef dual z = self.pow(other)
+        self.x = z.x
+        self.y = z.y
+        return self
+
+    def __eq__(self, other):
+        cdef double ox, oy
+        cdef double eps = pydual.precision
+        if _parts(other, &ox, &oy):
+            return NotImplemented
+        return fabs(self.x-ox) <= eps and fabs(self.y-oy) <= eps
+
+    def __ne__(self, other):
+        cdef double ox, oy
+        cdef double eps = pydual.precision
+        if _parts(other, &ox, &oy):
+            return NotImplemented
+        return fabs(self.x-ox) > eps or fabs(self.y-oy) > eps
+
+    def __lt__(self, other):
+        cdef double ox, oy
+        if _parts(other, &ox, &oy):
+            return NotImplemented
+        return self.x < ox
+
+    def __le__(self, other):
+        cdef double ox, oy
+        if _parts(other, &ox, &oy):
+            return NotImplemented
+        return self.x <= ox
+
+    def __gt__(self, other):
+        cdef double ox, oy
+        if _parts(other, &ox, &oy):
+            return NotImplemented
+        return self.x > ox
+
+    def __ge__(self, other):
+        cdef double ox, oy
+        if _parts(other, &ox, &oy):
+            return NotImplemented
+        return self.x >= ox
+
+    def re(self):
+        """Get real part"""
+        return self.x
+
+    def im(self):
+        """Get indeterminate part"""
+        return self.y
+
+    def abs(self):
+        """Get the magnitude"""
+        return self.x
+
+    def arg(self):
+        """Get the angle"""
+        return self.y / self.x
+
+    def conj(self):
+        """Get the conjugate number"""
+        return _new(self.x, -self.y)
+
+    def exp(self):
+        """Exponent"""
+        cdef double ex = exp(self.x)
+        return _new(ex, self.y*ex)
+
+    def pow(self, n):
+        """Power"""
+        cdef double a = self.x, b = self.y, c, d, p, la, ex
+        if _parts(n, &c, &d):
+            raise TypeError(f"unsupported exponent type '{type(n).__name__}'")
+        if c > 0:
+            if type(n) is int:
+                p = a**(n-1)
+                return _new(p*a, n*p*b)
+            la = log(a)
+            ex = exp(c*la)
+            return _new(ex, ex*(c*b/a+d*la))
+        elif c == 0:
+            return _new(1.0, 0.0)
+        else:
+            raise pydual.DualException("n must be non-negative")
+
+    def D(self):
+        """Derivative"""
+        return self.y
+
+    def sin(self):
+        """Sine"""
+        return _new(sin(self.x), self.y*cos(self.x))
+
+    def cos(self):
+        """Cosine"""
+        return _new(cos(self.x), -self.y*sin(self.x))
+
+    def tan(self):
+        """Tangent"""
+        cdef double c = cos(self.x)
+        return _new(sin(self.x)/c, self.y/(c*c))
+
+    def sinh(self):
+        """Hyperbolic sine"""
+        return _new(sinh(self.x), self.y*cosh(self.x))
+
+    def cosh(self):
+        """Hyperbolic cosine"""
+        return _new(cosh(self.x), self.y*sinh(self.x))
+
+    def tanh(self):
+        """Hyperbolic tangent"""
+        cdef double c = cosh(self.x)
+        return _new(sinh(self.x)/c, self.y/(c*c))
+
+    def log(self):
+        """Logarithm"""
+        return _new(log(self.x), self.y/self.x)
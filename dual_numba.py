@@ -0,0 +1,161 @@
+"""Dual number kernels for numba
+
+Each function takes the real and indeterminate parts of its dual arguments
+as plain floats and returns the parts of the result as a tuple, e.g.,
+
+    from numba import njit
+    from dual_numba import d_mul, d_sin
+
+    @njit
+    def f(x, y):
+        sx, sy = d_sin(x, y)
+        return d_mul(sx, sy, x, y)
+
+The kernels are inlined into the calling njit function so no dual objects
+are created in the compiled loop.
+"""
+
+from math import exp, log, sin, cos, sinh, cosh
+from numba import njit
+
+from dual import DualException
+
+
+@njit(inline="always")
+def d_neg(ax, ay):
+    """Negation"""
+    return -ax, -ay
+
+
+@njit(inline="always")
+def d_add(ax, ay, bx, by):
+    """Addition"""
+    return ax+bx, ay+by
+
+
+@njit(inline="always")
+def d_sub(ax, ay, bx, by):
+    """Subtraction"""
+    return ax-bx, ay-by
+
+
+@njit(inline="always")
+def d_mul(ax, ay, bx, by):
+    """Multiplication"""
+    return ax*bx, ax*by+ay*bx
+
+
+@njit(inline="always")
+def d_div(ax, ay, bx, by):
+    """Division"""
+    x = ax/bx
+    return x, (ay-x*by)/bx
+
+
+@njit(inline="always")
+def d_pow(ax, ay, n):
+    """Integer power"""
+    if n > 0:
+        p = ax**(n-1)
+        return p*ax, n*p*ay
+    elif n == 0:
+        return 1.0, 0.0
+    else:
+        raise DualException("n must be non-negative")
+
+
+@njit(inline="always")
+def d_exp(ax, ay):
+    """Exponent"""
+    ex = exp(ax)
+    return ex, ay*ex
+
+
+@njit(inline="always")
+def d_log(ax, ay):
+    """Logarithm"""
+    return log(ax), ay/ax
+
+
+@njit(inline="always")
+def d_sin(ax, ay):
+    """Sine"""
+    return sin(ax), ay*cos(ax)
+
+
+@njit(inline="always")
+def d_cos(ax, ay):
+    """Cosine"""
+    return cos(ax), -ay*sin(ax)
+
+
+@njit(inline="always")
+def d_tan(ax, ay):
+    """Tangent"""
+    c = cos(ax)
+    return sin(ax)/c, ay/(c*c)
+
+
+@njit(inline="always")
+def d_sinh(ax, ay):
+    """Hyperbolic sine"""
+    return sinh(ax), ay*cosh(ax)
+
+
+@njit(inline="always")
+def d_cosh(ax, ay):
+    """Hyperbolic cosine"""
+    return cosh(ax), ay*sinh(ax)
+
+
+@njit(inline="always")
+def d_tanh(ax, ay):
+    """Hyperbolic tangent"""
+    c = cosh(ax)
+    return sinh(ax)/c, ay/(c*c)
+
+
+if __name__ == "__main__":
+
+    import unittest
+    from dual import dual
+
+    x = dual(1, 2)
+    y = dual(3, 4)
+
+    class TestDualNumba(unittest.TestCase):
+
+        def test_arith(self):
+            self.assertEqual(dual(*d_neg(x.x, x.y)), -x)
+            self.assertEqual(dual(*d_add(x.x, x.y, y.x, y.y)), x+y)
+            self.assertEqual(dual(*d_sub(x.x, x.y, y.x, y.y)), x-y)
+            self.assertEqual(dual(*d_mul(x.x, x.y, y.x, y.y)), x*y)
+            self.assertEqual(dual(*d_div(x.x, x.y, y.x, y.y)), x/y)
+            for n in range(4):
+                self.assertEqual(dual(*d_pow(y.x, y.y, n)), y**n)
+            self.assertRaises(DualException, d_pow, y.x, y.y, -1)
+
+        def test_functions(self):
+            kernels = {
+                "exp": d_exp,
+                "log": d_log,
+                "sin": d_sin,
+                "cos": d_cos,
+                "tan": d_tan,
+                "sinh": d_sinh,
+                "cosh": d_cosh,
+                "tanh": d_tanh,
+            }
+            for name, kernel in kernels.items():
+                self.assertEqual(dual(*kernel(x.x, x.y)), getattr(x, name)(), name)
+
+        def test_inline(self):
+
+            @njit
+            def f(ax, ay):
+                sx, sy = d_sin(ax, ay)
+                return d_mul(sx, sy, ax, ay)
+
+            self.assertEqual(dual(*f(x.x, x.y)), x.sin()*x)
+
+    unittest.main()
@@ -0,0 +1,61 @@
+/* Batched dual number kernels for DualArray
+ *
+ * Build the shared library next to dual.py with
+ *
+ *     gcc -O3 -shared -fPIC -o libdual_simd.so dual_simd.c
+ *
+ * The AVX2/FMA loop is selected at run time when the CPU supports it, so the
+ * library can be built without -mavx2 and still runs on older processors.
+ */
+
+#include <stddef.h>
+
+#if defined(__GNUC__) && (defined(__x86_64__) || defined(__i386__))
+#include <immintrin.h>
+#define DUAL_SIMD_X86 1
+#endif
+
+/* Multiply n dual numbers: (rx + ry w) = (ax + ay w) * (bx + by w) */
+static void dmul_scalar(size_t i, size_t n,
+                        const double *ax, const double *ay,
+                        const double *bx, const double *by,
+                        double *rx, double *ry)
+{
+    for ( ; i < n; ++i ) {
+        double x = ax[i]*bx[i];
+        ry[i] = ax[i]*by[i] + ay[i]*bx[i];
+        rx[i] = x;
+    }
+}
+
+#ifdef DUAL_SIMD_X86
+__attribute__((target("avx2,fma")))
+static void dmul_avx2(size_t n,
+                      const double *ax, const double *ay,
+                      const double *bx, const double *by,
+                      double *rx, double *ry)
+{
+    size_t i = 0;
+    for ( ; i+4 <= n; i += 4 ) {
+        __m256d AX = _mm256_loadu_pd(ax+i), AY = _mm256_loadu_pd(ay+i);
+        __m256d BX = _mm256_loadu_pd(bx+i), BY = _mm256_loadu_pd(by+i);
+        _mm256_storeu_pd(ry+i, _mm256_fmadd_pd(AX, BY, _mm256_mul_pd(AY, BX)));
+        _mm256_storeu_pd(rx+i, _mm256_mul_pd(AX, BX));
+    }
+    dmul_scalar(i, n, ax, ay, bx, by, rx, ry);
+}
+#endif
+
+void dmul(size_t n,
+          const double *ax, const double *ay,
+          const double *bx, const double *by,
+          double *rx, double *ry)
+{
+#ifdef DUAL_SIMD_X86
+    if ( __builtin_cpu_supports("avx2") && __builtin_cpu_supports("fma") ) {
+        dmul_avx2(n, ax, ay, bx, by, rx, ry);
+        return;
+    }
+#endif
+    dmul_scalar(0, n, ax, ay, bx, by, rx, ry);
+}